@@ -17,10 +17,18 @@
 Some helper functions for easier parsing of values.
 """
 import difflib
+import functools
+import re
 
 from .data import ALL_GPUS, ALL_CPUS, MODEL_TO_GPU, MODEL_TO_CPU
 from ._models import GPU, CPU, SystemSetup
 
+rapidfuzz_available = True
+try:
+    from rapidfuzz import process, fuzz
+except ImportError:
+    rapidfuzz_available = False
+
 
 def _resource_contents(resource: str, subfolder: str = "resources") -> dict:
     """
@@ -34,6 +42,27 @@ def _resource_contents(resource: str, subfolder: str = "resources") -> dict:
     return json.loads(content)
 
 
+# the factor each unit carries, so the conversion functions below are just one
+# dict lookup instead of a comparison ladder
+BYTE_UNITS = {
+    "b": 1,
+    "kb": 1024,
+    "kib": 1024,
+    "mb": 1024 ** 2,
+    "mib": 1024 ** 2,
+    "gb": 1024 ** 3,
+    "gib": 1024 ** 3,
+    "tb": 1024 ** 4,
+    "tib": 1024 ** 4,
+}
+HERTZ_UNITS = {
+    "khz": 10 ** 3,
+    "mhz": 10 ** 6,
+    "ghz": 10 ** 9,
+    "thz": 10 ** 12,
+}
+
+
 def human_readable_to_bytes(value: int, unit: str) -> int:
     """
     Converts the given value and unit to bytes.
@@ -43,40 +72,114 @@ def human_readable_to_bytes(value: int, unit: str) -> int:
     MiB, which is 1024 * 1024. Even Windows displays as unit MB, even though
     it's actually MiB.
     """
-    unit = unit.casefold()
-
-    if unit == "b":
-        return value
-    elif unit == "kb" or unit == "kib":
-        return value * 1024
-    elif unit == "mb" or unit == "mib":
-        return value * (1024 ** 2)
-    elif unit == "gb" or unit == "gib":
-        return value * (1024 ** 3)
-    elif unit == "tb" or unit == "tib":
-        return value * (1024 ** 4)
-    else:
-        # there's more, but that's extremely unlikely
-        return value
+    # unknown units just default to factor 1
+    # there's more than what's listed, but that's extremely unlikely
+    return value * BYTE_UNITS.get(unit.casefold(), 1)
 
 
 def human_readable_to_hertz(value: int, unit: str) -> int:
     """
     Converts the given hertz and unit (GHz or MHz or whatever) to Hz.
     """
-    unit = unit.casefold()
+    # see human_readable_to_bytes for the handling of unknown units
+    return value * HERTZ_UNITS.get(unit.casefold(), 1)
 
-    if unit == "khz":
-        return value * (10 ** 3)
-    elif unit == "mhz":
-        return value * (10 ** 6)
-    elif unit == "ghz":
-        return value * (10 ** 9)
-    elif unit == "thz":
-        return value * (10 ** 12)
-    else:
-        # see human_readable_to_bytes
-        return value
+
+# the candidate lists handed to rapidfuzz, cached by database identity since
+# rebuilding the list on every single lookup would throw away a good part of
+# the speedup again
+_model_lists = {}
+
+# (casefolded model, original model) pairs for the substring fast-path, also
+# cached by database identity so the casefolding is only paid once per process
+_folded_models = {}
+
+# maps id(database) -> {token: set of models containing that token}, used to
+# shrink the candidate set before any fuzzy matching happens
+_token_indices = {}
+
+# what counts as a token, both in model names and in queries
+TOKEN_REGEX = re.compile(r"[a-z0-9]+")
+
+# finds the first number in a RAM clutter string together with the word
+# directly after it, which is hopefully the unit
+# the lookbehinds keep the number a standalone token — without them, the "4"
+# out of "DDR4 16384 MB" or the "4800" out of "ddr5-4800 32 GiB" would count
+# as the size
+RAM_REGEX = re.compile(r"(?<![a-z0-9])(?<![a-z0-9]-)(\d+)\s*([a-z]+)?")
+
+# everything that gets thrown away when normalizing a model name down to its
+# alphanumeric core ("i5-3570K" -> "i53570k")
+NORMALIZE_REGEX = re.compile(r"[\W_]+")
+
+# maps id(database) -> {normalized model: original model}, so exact models
+# hiding behind different punctuation/casing are one dict lookup away
+_normalized_models = {}
+
+
+def _normalized_models_of(database: dict) -> dict:
+    """
+    Returns the (cached) mapping of normalized model names to their original
+    spelling for the given database.
+    """
+    normalized = _normalized_models.get(id(database))
+    if normalized is None:
+        normalized = {
+            NORMALIZE_REGEX.sub("", model.casefold()): model
+            for model in database.keys()
+        }
+        _normalized_models[id(database)] = normalized
+    return normalized
+
+
+def _models_of(database: dict) -> list:
+    """
+    Returns the (cached) list of all model names in the given database.
+    """
+    models = _model_lists.get(id(database))
+    if models is None:
+        models = list(database.keys())
+        _model_lists[id(database)] = models
+    return models
+
+
+def _token_index_of(database: dict) -> dict:
+    """
+    Returns the (cached) token index of the given database, mapping each
+    alphanumeric token appearing in a model name to the set of all models
+    containing it.
+    """
+    index = _token_indices.get(id(database))
+    if index is None:
+        index = {}
+        for model in database.keys():
+            for token in TOKEN_REGEX.findall(model.casefold()):
+                index.setdefault(token, set()).add(model)
+        _token_indices[id(database)] = index
+    return index
+
+
+def _folded_models_of(database: dict) -> tuple:
+    """
+    Returns (cached) pairs of (casefolded model, original model) for the given
+    database.
+    """
+    pairs = _folded_models.get(id(database))
+    if pairs is None:
+        pairs = tuple(
+                (model.casefold(), model)
+                for model in database.keys()
+            )
+        _folded_models[id(database)] = pairs
+    return pairs
+
+
+# maps id(database) -> database so the memoized _lookup below can get back to
+# the actual dict while only hashing the id
+# (a WeakValueDictionary would be nicer, but plain dicts can't be weakly
+# referenced — the databases are module-level constants anyway, so holding a
+# strong reference doesn't leak anything)
+_databases = {}
 
 
 def _find_by_model(cls, database: dict, unexact_model: str):
@@ -87,18 +190,96 @@ def _find_by_model(cls, database: dict, unexact_model: str):
     # don't worry about the function signature, I just didn't find any suitable
     # way to say typing that a class comes in here and an object depending on
     # the database comes out
+    _databases[id(database)] = database
+    return _lookup(id(database), unexact_model)
+
 
-    # use difflib to find the closest match
+@functools.lru_cache(maxsize=1024)
+def _lookup(db_id: int, unexact_model: str):
+    """
+    The actual matching core behind _find_by_model. Memoized, since callers
+    like setup_from_clutter tend to come around with the very same clutter
+    strings over and over again.
+    """
+    database = _databases[db_id]
+
+    folded_query = unexact_model.casefold()
+
+    # cheapest first: maybe the query *is* a model, just spelled with
+    # different punctuation or casing (or with its tokens glued differently,
+    # "i5 3570k" -> "i53570k") — then the normalized dict answers in O(1)
+    # only the *full* query is probed on purpose: single tokens or token
+    # pairs of a cluttered query happily hit the wrong model (the databases
+    # contain bare-number models like "9320" and shadowed ones like "e3-1220"
+    # next to "e3-1220 v3"), so anything less than the whole query belongs to
+    # the matching stages below
+    normalized = _normalized_models_of(database)
+    model = normalized.get(NORMALIZE_REGEX.sub("", folded_query))
+    if model is not None:
+        return database[model]
+
+    # most real queries contain the model as an exact substring (think of
+    # "Intel Core i9-1337M CPU @ 4.20GHz" containing "i9-1337M"), so check for
+    # that first and skip the whole fuzzy machinery on a hit
+    # the *longest* hit wins — the databases are full of shadowed models
+    # ("e3-1220" next to "e3-1220 v3", or the bare-number ones), and taking
+    # whichever happens to come first would resolve to the wrong component
+    best_model = None
+    best_length = 0
+    for folded_model, model in _folded_models_of(database):
+        if len(folded_model) > best_length and folded_model in folded_query:
+            best_model = model
+            best_length = len(folded_model)
+    if best_model is not None:
+        return database[best_model]
+
+    # before doing any fuzzy work, shrink the candidate set: most queries
+    # carry at least one distinctive token ("i5", "3570k", "gtx", ...), so
+    # only models sharing a token with the query are worth looking at
+    index = _token_index_of(database)
+    tokens = TOKEN_REGEX.findall(folded_query)
+    candidates = set()
+    for token in tokens:
+        candidates |= index.get(token, set())
+    if not candidates:
+        # no token in common with anything, the fuzzy matcher has to chew
+        # through the full database then
+        candidates = _models_of(database)
+    else:
+        candidates = list(candidates)
+
+    if rapidfuzz_available:
+        # rapidfuzz runs the whole candidate list through its C++ backend in
+        # one batched call, which beats the difflib loop below by an order of
+        # magnitude
+        match = process.extractOne(
+                unexact_model,
+                candidates,
+                scorer=fuzz.partial_ratio,
+                score_cutoff=1,
+            )
+
+        if match is None:
+            # didn't find any matches :(
+            return None
+
+        return database[match[0]]
+
+    # no rapidfuzz around, fall back to difflib
     # we use a SequenceMatcher here as we can just feed in all models in the
     # database and take the longest match
-    sequence_matcher = difflib.SequenceMatcher(b=unexact_model)
+    # one single matcher is reused for all candidates on purpose: b (and its
+    # internal index) is only processed once, set_seq1 below is cheap —
+    # autojunk would additionally throw away parts of b's index for longer
+    # queries, so it's disabled
+    sequence_matcher = difflib.SequenceMatcher(b=unexact_model, autojunk=False)
 
     # we use current_score to hold state which model was the best one until yet,
     # and exact_model for the full model name in the DB then
     current_score = 0
     exact_model = None
 
-    for model in database.keys():
+    for model in candidates:
         # find match and compare it to the existing one
 
         # say the SequenceMatcher which sequence we want to match on
@@ -181,27 +362,15 @@ def setup_from_clutter(cpu_clutter: str, gpu_clutter: str, ram_clutter: str) ->
     # for the RAM we need some parsing though
     # the idea is to find the first number in the string, the word after it is
     # probably the unit
-    try:
-        ram_clutter = ram_clutter.casefold().split(" ")
-        value = None
-        unit = None
-        for i, part in enumerate(ram_clutter):
-            if part.isdigit():
-                # it's the number! but what's the unit?
-                value = int(part)
-                if i == len(ram_clutter) - 1:
-                    # oh no, but it's the last element, let's just set it to
-                    # bytes
-                    unit = "b"
-                else:
-                    # so it's hopefully just 1 word after it
-                    unit = ram_clutter[i + 1]
-                break
-        
-        ram = human_readable_to_bytes(value, unit)
-    except:
+    match = RAM_REGEX.search(ram_clutter.casefold())
+    if match is None:
+        # no number in there at all
         # ¯\_(ツ)_/¯
         ram = None
+    else:
+        # if there's no word after the number, just assume bytes
+        unit = match.group(2) or "b"
+        ram = human_readable_to_bytes(int(match.group(1)), unit)
 
     # now that we have CPU, GPU and RAM, make a setup and return to the studio
     setup = SystemSetup(cpu, gpu, ram)
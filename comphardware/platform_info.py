@@ -16,8 +16,14 @@
 """
 Functions for getting information on the current running platform.
 """
+import functools
+import glob
+import os
+import pathlib
 import platform
+import re
 import subprocess
+import sys
 from typing import Optional
 from xml.etree import ElementTree
 
@@ -39,30 +45,132 @@ from .helpers import find_gpu_by_model, find_cpu_by_model, SystemSetup
 
 
 # formed with help from https://docs.microsoft.com/en-us/windows/win32/cimwin32prov/win32-videocontroller
+# Get-CimInstance is the modern way, WMIC is deprecated (and takes ~500ms to
+# even spawn), but we keep the latter around as fallback for old hosts
+POWERSHELL_QUERY_COMMAND = [
+    "powershell", "-NoProfile", "-Command",
+    "Get-CimInstance Win32_VideoController"
+    " | Select-Object -ExpandProperty Name",
+]
 WMIC_QUERY_COMMAND = ["WMIC", "PATH", "Win32_VideoController", "GET", "Name"]
 # and that one is just straight taken from the manpage
 IOREG_COMMAND = ["/usr/sbin/ioreg", "-la"]
 
+# where the PCI ID database usually lives, depending on the distribution
+PCI_IDS_PATHS = ["/usr/share/hwdata/pci.ids", "/usr/share/misc/pci.ids"]
+# the PCI class for "VGA compatible controller"
+VGA_CLASS = "0x0300"
 
-_cached_cpu = 0
-_cached_gpu = 0
+# extracts the interesting part of a PCI device name in one scan: prefer the
+# bracketed marketing name ("GF119M [NVS 4200M]" -> "NVS 4200M"), otherwise
+# take everything up to the first parenthesis ("(rev a1)" and friends)
+GPU_NAME_REGEX = re.compile(r"[^([\]]*\[([^\]]+)\]|([^(]+)")
 
+_pci_names_cache = None
 
-def user_cpu() -> CPU:
+
+def _pci_names() -> dict:
     """
-    Tries to determine the user's CPU, depending on the current platform.
-    Returns None if the CPU can't be found in the database or is unable to be
-    determined.
+    Parses the pci.ids database into a {(vendor_id, device_id): name} dict.
+    Both IDs are lowercase hex strings without the 0x prefix. Parsed only once,
+    afterwards the cached dict is returned.
     """
-    global _cached_cpu
+    global _pci_names_cache
+    if _pci_names_cache is not None:
+        return _pci_names_cache
+
+    names = {}
+    for path in PCI_IDS_PATHS:
+        try:
+            with open(path, encoding="latin-1") as fh:
+                current_vendor = None
+                for line in fh:
+                    if not line.strip() or line.startswith("#"):
+                        continue
+                    if line.startswith("\t\t"):
+                        # subsystems, we don't care about those
+                        continue
+                    elif line.startswith("\t"):
+                        # a device of the current vendor, looking like
+                        #   \t1049  GF119M [NVS 4200M]
+                        if current_vendor is None:
+                            continue
+                        device, _, name = line.strip().partition("  ")
+                        names[(current_vendor, device)] = name
+                    else:
+                        # a vendor line, looking like
+                        #   10de  NVIDIA Corporation
+                        current_vendor = line.split("  ")[0]
+            break
+        except OSError:
+            # try the next known location instead
+            continue
+
+    _pci_names_cache = names
+    return names
+
+
+# whether user_gpu already ran its probes — GPU probing can't use lru_cache
+# like user_cpu does, since a failed probe has to be cached as well (GLUT
+# really doesn't like being initialized twice)
+_gpu_probe_done = False
+_cached_gpu = None
+
 
-    # there is no need in trying to extract it again if we know it already
-    if not isinstance(_cached_cpu, int):
-        return _cached_cpu
+# where the raw CPU brand string is cached across processes — the CPU doesn't
+# change between reboots, so probing once per machine is enough
+CPU_BRAND_CACHE = pathlib.Path.home() / ".cache" / "comphardware" \
+    / "cpu_brand.txt"
 
-    # first find the CPU model itself (just misuse py-cpuinfo here)
+
+def _cluttered_cpu_model() -> Optional[str]:
+    """
+    Returns the raw CPU brand string, preferring the on-disk cache over the
+    quite expensive cpuinfo probe. Returns None if it can't be determined.
+    """
+    # the cache is keyed on the hostname, so copying the home directory to
+    # another machine doesn't serve a stale CPU
+    node = platform.node()
+    try:
+        cached = CPU_BRAND_CACHE.read_text().split("\n")
+        if len(cached) >= 2 and cached[0] == node:
+            return cached[1]
+    except OSError:
+        # no cache yet (or unreadable), probe below
+        pass
+
+    # just misuse py-cpuinfo here
     # thanks Dummerle! uwu
     cluttered_cpu = cpuinfo.get_cpu_info().get("brand_raw", None)
+    if not cluttered_cpu:
+        return None
+
+    try:
+        CPU_BRAND_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        # write-then-replace so a crash halfway through doesn't leave a
+        # half-written cache behind
+        tempfile = CPU_BRAND_CACHE.with_suffix(".tmp")
+        tempfile.write_text(f"{node}\n{cluttered_cpu}")
+        os.replace(tempfile, CPU_BRAND_CACHE)
+    except OSError:
+        # can't write the cache? well, then we'll just probe again next time
+        pass
+
+    return cluttered_cpu
+
+
+@functools.lru_cache(maxsize=1)
+def user_cpu() -> CPU:
+    """
+    Tries to determine the user's CPU, depending on the current platform.
+    Returns None if the CPU can't be found in the database or is unable to be
+    determined.
+
+    The result is cached, so the (quite expensive) probing only happens once
+    per process.
+    """
+    # first find the CPU model itself
+    cluttered_cpu = _cluttered_cpu_model()
 
     # returning preliminary if the CPU string is empty
     if not cluttered_cpu:
@@ -73,8 +181,6 @@ def user_cpu() -> CPU:
     # if it's in it
     actual_cpu = find_cpu_by_model(cluttered_cpu)
 
-    _cached_cpu = actual_cpu
-
     return actual_cpu
 
 
@@ -134,61 +240,71 @@ def _user_gpu_by_platform() -> str:
     an Exception if the platform isn't supported (yet).
     """
     gpu_model = None
-    system = platform.system()
-
-    if system == "Linux":
-        lspci_output = subprocess.check_output("lspci", text=True).split("\n")
-        # a line in the output of lspci looks like this
-        #   01:00.0 VGA compatible controller: NVIDIA Corporation GF119M [NVS 4200M] (rev a1)
-        # I'll just split at : and take the last element (note the : directly at
-        # the start)
-        for line in lspci_output:
-            if line.strip() == "":
+    # sys.platform is a plain constant — unlike platform.system(), which may
+    # even fork uname on some platforms, and this here is a hot path now
+    system = sys.platform
+
+    if system.startswith("linux"):
+        # no need to fork lspci — the kernel exposes all PCI devices under
+        # /sys/bus/pci anyway, we just have to resolve the IDs ourselves via
+        # pci.ids (which is the same file lspci reads)
+        for device_path in glob.glob("/sys/bus/pci/devices/*"):
+            try:
+                with open(f"{device_path}/class") as fh:
+                    pci_class = fh.read().strip()
+                if not pci_class.startswith(VGA_CLASS):
+                    # not a VGA controller, not interesting
+                    continue
+                with open(f"{device_path}/vendor") as fh:
+                    vendor_id = fh.read().strip().removeprefix("0x")
+                with open(f"{device_path}/device") as fh:
+                    device_id = fh.read().strip().removeprefix("0x")
+            except OSError:
+                # the device vanished or sysfs is weird, skip it
                 continue
-            elif "VGA compatible controller" in line:
-                colon_splitted = line.split(":")
-                raw_model = colon_splitted[-1]
-
-                gpu_model = ""
-                # let's remove clutter like (rev a1)
-                for i, char in enumerate(raw_model):
-                    if char == "(":
-                        # well, the perfect example: (rev a1)
-                        break
-                    elif char == "]":
-                        # oh, that's way more interesting than the rest of the
-                        # raw model (like you see above with [NVS 4200M])
-
-                        # illustration:
-                        #   doging doge 21235 doge [Doge 4450A] (doge)
-                        #                                     ^
-                        #                                     i
-                        before_closing_bracket = raw_model[:i]
-                        gpu_model = before_closing_bracket.split("[")[-1]
-                        break  # if we wouldn't break here, it would happily
-                               # append everything behind ] also to the GPU
-                               # model
-                    else:
-                        gpu_model += char
-
-                # not breaking as I found the last card being more important
-                # (heavily depends on the setup though)
-
-    elif system == "Windows":
-        # yep, a query using WMIC might seem a bit weird, but maybe relying on
-        # WMIC is better than having wmi as dependency (which failed on Wine
-        # qwq)
-        # the output of the WMIC query looks like this
-        #   "Name                    \r\nNVIDIA GeForce GTX 470  \r\n"
-        wmic_query_output = subprocess \
-            .check_output(WMIC_QUERY_COMMAND) \
-            .decode(encoding="utf-16")  # thanks for that jumpscare, UTF-16
-
-        # so what should we do? of course, we just take the second line,
-        # whatever
-        gpu_model = wmic_query_output.split("\r\n")[1]
-
-    elif system == "Darwin":
+
+            raw_model = _pci_names().get((vendor_id, device_id))
+            if raw_model is None:
+                # unknown to pci.ids (or pci.ids isn't installed)
+                continue
+
+            # a name out of pci.ids looks like
+            #   GF119M [NVS 4200M]
+            # and we only want the part in brackets (if any)
+            match = GPU_NAME_REGEX.match(raw_model)
+            if match is None:
+                continue
+            gpu_model = (match.group(1) or match.group(2)).strip()
+
+            # not breaking out of the device loop as I found the last card
+            # being more important (heavily depends on the setup though)
+
+    elif system == "win32":
+        # maybe querying via subprocess might seem a bit weird, but it's still
+        # better than having wmi as dependency (which failed on Wine qwq)
+        try:
+            # the PowerShell query just prints one name per line
+            powershell_output = subprocess.check_output(
+                    POWERSHELL_QUERY_COMMAND,
+                    text=True,
+                )
+            for line in powershell_output.split("\n"):
+                if line.strip():
+                    gpu_model = line.strip()
+                    break
+        except (OSError, subprocess.CalledProcessError):
+            # no PowerShell around? then WMIC it is
+            # the output of the WMIC query looks like this
+            #   "Name                    \r\nNVIDIA GeForce GTX 470  \r\n"
+            wmic_query_output = subprocess \
+                .check_output(WMIC_QUERY_COMMAND) \
+                .decode(encoding="utf-16")  # thanks for that jumpscare, UTF-16
+
+            # so what should we do? of course, we just take the second line,
+            # whatever
+            gpu_model = wmic_query_output.split("\r\n")[1]
+
+    elif system == "darwin":
         # the idea is to parse the output of `/usr/sbin/ioreg -la`, which is
         # XML, and then to find the one string value which contains "MTLDriver"
         # that's the GPU
@@ -217,21 +333,36 @@ def _user_gpu_by_platform() -> str:
 def user_gpu(force_no_window=False) -> Optional[GPU]:
     """
     Tries to get the GPU by
-    
-    1. Trying to open a window with GLUT/freeglut, creating an OpenGL context
-       and getting the renderer (not tried if force_no_window is set to True)
-    2. Using a platform-dependent way, which is often way less precise though.
+
+    1. Using a platform-dependent way, which on Linux is now just a few sysfs
+       reads and thereby basically free.
+    2. Trying to open a window with GLUT/freeglut, creating an OpenGL context
+       and getting the renderer (not tried if force_no_window is set to True).
 
     Returns None if all methods failed.
     """
+    global _gpu_probe_done
     global _cached_gpu
-    # first of all, do we have it cached? if yes, just return it
-    if not isinstance(_cached_gpu, int):
+    # first of all, did we probe already? if yes, just return the result, even
+    # if the probe came up with nothing — retrying wouldn't make it better and
+    # GLUT can't be initialized a second time anyways
+    if _gpu_probe_done:
         return _cached_gpu
 
-    # then try all methods we've got so far
+    # the platform-dependent way goes first, since it doesn't have to spin up
+    # a whole window with mainloop just to ask one question
     gpu_model = None
-    if not force_no_window:
+    try:
+        gpu_model = _user_gpu_by_platform()
+    except:
+        # platform unsupported :(
+        pass
+
+    # only if the cheap way didn't lead anywhere, resort to GLUT
+    window_probe_attempted = False
+    if (gpu_model is None or find_gpu_by_model(gpu_model) is None) \
+            and not force_no_window:
+        window_probe_attempted = True
         try:
             gpu_model = _user_gpu_by_opengl()
         except:
@@ -239,19 +370,18 @@ def user_gpu(force_no_window=False) -> Optional[GPU]:
             # can fall in when using OpenGL/GLUT
             # either way, unable to extract GPU
             pass
-    
-    if gpu_model is None:
-        try:
-            gpu_model = _user_gpu_by_platform()
-        except:
-            # platform unsupported :(
-            pass
-
-    if gpu_model is None:
-        return None
 
-    actual_gpu = find_gpu_by_model(gpu_model)
-    _cached_gpu = actual_gpu
+    actual_gpu = None
+    if gpu_model is not None:
+        actual_gpu = find_gpu_by_model(gpu_model)
+
+    # a found GPU is always worth caching — a failure only once the window
+    # probe actually ran: with force_no_window GLUT was never initialized, so
+    # the can't-init-twice rule doesn't bite yet and a later call that allows
+    # windows still deserves its shot
+    if actual_gpu is not None or window_probe_attempted:
+        _gpu_probe_done = True
+        _cached_gpu = actual_gpu
 
     return actual_gpu
 
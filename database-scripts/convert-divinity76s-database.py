@@ -17,8 +17,10 @@
 Downloads and converts divinity76's database at
 https://github.com/divinity76/intel-cpu-database to "our" database format.
 """
-import json
-import requests
+import multiprocessing
+import urllib.request
+
+import orjson
 import helpers
 import dogelog
 
@@ -28,13 +30,64 @@ URL = "https://raw.githubusercontent.com/divinity76/intel-cpu-database/master/da
 
 def download(url: str) -> dict:
     """
-    Downloads the given URL and uses json.loads to convert it to a dict.
+    Downloads the given URL and uses orjson.loads to convert it to a dict.
     """
     dogelog.info("Downloading raw database")
 
-    response = requests.get(URL)
-    response.raise_for_status()
-    return json.loads(response.text)
+    # plain urllib does everything needed for one GET of a raw file, no need
+    # to pull in (and pay the import time of) requests for that
+    with urllib.request.urlopen(URL) as response:
+        if response.status != 200:
+            raise Exception(f"Got HTTP status {response.status} for {URL}")
+
+        # stream the body in chunks instead of materializing it multiple
+        # times, and feed the raw bytes directly to orjson, no need to decode
+        # to str first
+        buf = bytearray()
+        while chunk := response.read(65536):
+            buf += chunk
+    return orjson.loads(bytes(buf))
+
+
+def _convert_one(item) -> helpers.CPU:
+    """
+    Converts one (product_id, specs) entry of the source database into a CPU,
+    or returns None if the entry isn't interesting/parseable.
+    """
+    key, specs = item
+
+    model = specs.get("Essentials", {}).get("Processor Number", None)
+    performance = specs.get("Performance", {})
+    raw_corecount = performance.get("# of Cores", None)
+    raw_frequency = performance.get("Processor Base Frequency", None)
+
+    if model is None or raw_corecount is None or raw_frequency is None:
+        # just... don't care... welp
+        return None
+
+    try:
+        # the remaining try only guards the numeric conversions, some entries
+        # contain values like "N/A" in there
+        product_id = int(key)
+        corecount = int(raw_corecount)
+
+        raw = raw_frequency.split(" ")
+        value = float(raw[0])
+        unit = raw[1]
+        corespeed = helpers.human_readable_to_hertz(value, unit)
+    except (ValueError, IndexError):
+        # uninteresting
+        # maybe I could try to get other factors for caluculating a score
+        # here, but still, uninteresting
+        return None
+
+    return helpers.CPU(
+        model,
+        product_id,
+        "intel",
+        corecount,
+        corespeed,
+    )
 
 
 def convert(source: dict) -> list[helpers.CPU]:
@@ -67,36 +120,18 @@ def convert(source: dict) -> list[helpers.CPU]:
     #     ...
     # },
     dogelog.info("Converting")
-    cpus = []
-    for key, specs in source.items():
-        try:
-            product_id = int(key)
-            
-            model = specs["Essentials"].get("Processor Number", None)
-            if model is None:
-                # just... don't care... welp
-                continue
-
-            corecount = int(specs["Performance"]["# of Cores"])
-            
-            raw = specs["Performance"]["Processor Base Frequency"].split(" ")
-            value = float(raw[0])
-            unit = raw[1]
-            corespeed = helpers.human_readable_to_hertz(value, unit)
-
-            cpus.append(helpers.CPU(
-                model,
-                product_id,
-                "intel",
-                corecount,
-                corespeed,
-            ))
-        except (ValueError, KeyError):
-            # uninteresting
-            # maybe I could try to get other factors for caluculating a score
-            # here, but still, uninteresting
-            continue
-    return cpus
+    # the entries are completely independent from each other, so just shard
+    # them over all cores; the big chunksize keeps the pickling overhead down
+    with multiprocessing.Pool() as pool:
+        return [
+            cpu
+            for cpu in pool.imap_unordered(
+                _convert_one,
+                source.items(),
+                chunksize=512,
+            )
+            if cpu is not None
+        ]
 
 
 if __name__ == "__main__":
@@ -19,15 +19,25 @@ While the extensive mode looks like this:
 [2021.06.02 22:11:57] [ERROR ##] Can't find `Anime` in preferences!
 """
 import atexit
-import datetime
 import enum
 import sys
+import threading
 import time
 from PIL.ImageColor import getrgb
 
 
 COLOR_START = "\033[38;2;{0};{1};{2}m"
 RESET = "\033[0m"
+# only restores the default foreground color — the prefixes never touch
+# anything else, so emitting a full SGR reset for them just wastes bytes
+RESET_FG = "\033[39m"
+# jump to the line start and erase to the end of it, in one go — way cheaper
+# than backspacing over and blanking out the old bar character by character
+ERASE_LINE = "\r\033[K"
+
+# don't redraw the progress bar more often than this (in seconds) — the
+# terminal can't display it any faster anyways
+REDRAW_INTERVAL = 0.033
 
 CYAN = COLOR_START.format(*getrgb("#00ffff"))
 VIOLET = COLOR_START.format(*getrgb("#5f00ff"))
@@ -61,54 +71,201 @@ logfile = None
 progress = None
 
 
+# every write() is a syscall, so log entries and progress redraws are
+# collected here first and written out in batches — either once enough piled
+# up, or at latest when the flush timer fires
+FLUSH_THRESHOLD = 8192
+FLUSH_INTERVAL = 0.2
+
+_buffer = []
+_buffer_len = 0
+_buffer_target = None
+_flush_timer = None
+# log calls can come from worker threads (think of the ARK fetchers), so the
+# buffer needs protecting
+_buffer_lock = threading.Lock()
+
+
+def flush():
+    """Writes out everything that's still sitting in the write buffer."""
+    with _buffer_lock:
+        _flush_locked()
+
+
+def _flush_locked():
+    """The actual flush. Only call while holding _buffer_lock."""
+    global _buffer, _buffer_len, _flush_timer
+
+    if _flush_timer is not None:
+        _flush_timer.cancel()
+        _flush_timer = None
+    if not _buffer:
+        return
+
+    target = _buffer_target if _buffer_target is not None else sys.stdout
+    data = "".join(_buffer)
+    _buffer = []
+    _buffer_len = 0
+
+    if not hasattr(target, "encoding"):
+        # a binary target, we have to encode ourselves then
+        data = data.encode()
+    target.write(data)
+    target.flush()
+
+
+def _buffered_write(text: str, target, force: bool = False):
+    """
+    Queues the given text to be written to the given target. Actually written
+    is only once enough text accumulated, the flush timer fires, or force is
+    set (which errors do, those shouldn't wait around in a buffer).
+    """
+    global _buffer_len, _buffer_target, _flush_timer
+
+    with _buffer_lock:
+        if target is not _buffer_target:
+            # the target switched (stdout <-> stderr/logfile), write the old
+            # one out first so nothing gets reordered
+            _flush_locked()
+            _buffer_target = target
+
+        _buffer.append(text)
+        _buffer_len += len(text)
+
+        if force or _buffer_len >= FLUSH_THRESHOLD:
+            _flush_locked()
+        elif _flush_timer is None:
+            _flush_timer = threading.Timer(FLUSH_INTERVAL, flush)
+            _flush_timer.daemon = True
+            _flush_timer.start()
+
+
+# the last formatted timestamp and the second it belongs to — log bursts
+# within the same second all reuse the very same string
+_last_ts_sec = 0
+_last_ts_str = ""
+
+
 def get_formatted_datetime():
     """
     Returns a pretty formatted datetime string in this format:
         YYYY.mm.dd HH.MM.SS
     """
-    return datetime.datetime \
-        .now() \
-        .strftime("%Y.%m.%d %H:%M:%S")
+    global _last_ts_sec
+    global _last_ts_str
+
+    sec = int(time.time())
+    if sec != _last_ts_sec:
+        _last_ts_sec = sec
+        # time.strftime on a struct_time is notably faster than taking the
+        # detour over a full datetime object
+        _last_ts_str = time.strftime("%Y.%m.%d %H:%M:%S", time.localtime(sec))
+    return _last_ts_str
+
+
+# the prefix per (mode, level) is a pure constant — in EXTENSIVE mode with a
+# {0} placeholder for the timestamp — so build them all exactly once instead
+# of running an if/elif cascade on every single log call
+_PREFIXES = {
+    Mode.NONE: {
+        DEBUG: "//",
+        INFO: "::",
+        ERROR: "##",
+    },
+    Mode.NORMAL: {
+        DEBUG: f"{VIOLET}//{RESET_FG}",
+        INFO: f"{CYAN}::{RESET_FG}",
+        ERROR: f"{ORANGE}##{RESET_FG}",
+    },
+    Mode.EXTENSIVE: {
+        DEBUG: "[{0}] [DEBUG //]",
+        INFO: "[{0}] [INFO  ::]",
+        ERROR: "[{0}] [ERROR ##]",
+    },
+}
+
+# the visible prefix width is constant per mode as well (escape codes don't
+# count, and the timestamp is always 19 characters), so the indent for
+# follow-up lines of multiline messages can be precomputed too
+_INDENTS = {
+    Mode.NONE: " " * 2,
+    Mode.NORMAL: " " * 2,
+    Mode.EXTENSIVE: " " * len(_PREFIXES[Mode.EXTENSIVE][DEBUG].format(" " * 19)),
+}
 
 
 def format_level(level):
     """
     Converts the given level into their representation in my logging system.
     """
-    if mode == Mode.NONE:
-        if level == DEBUG:
-            return "//"
-        elif level == INFO:
-            return "::"
-        elif level == ERROR:
-            return "##"
-
-    elif mode == Mode.NORMAL:
-        if level == DEBUG:
-            return f"{VIOLET}//{RESET}"
-        elif level == INFO:
-            return f"{CYAN}::{RESET}"
-        elif level == ERROR:
-            return f"{ORANGE}##{RESET}"
-
+    prefix = _PREFIXES[mode][level]
     if mode == Mode.EXTENSIVE:
-        now = get_formatted_datetime()
-        if level == DEBUG:
-            return f"[{now}] [DEBUG //]"
-        elif level == INFO:
-            return f"[{now}] [INFO  ::]"
-        elif level == ERROR:
-            return f"[{now}] [ERROR ##]"
+        # only the timestamp actually varies
+        prefix = prefix.format(get_formatted_datetime())
+    return prefix
+
+
+# the logfile sits behind an 8 KiB write buffer, and this timer makes sure
+# that buffer hits the disk at least once a second — so a crash can only ever
+# eat the last second of entries
+LOGFILE_FLUSH_INTERVAL = 1.0
+_logfile_flush_timer = None
+
+
+def _flush_logfile_and_reschedule():
+    global _logfile_flush_timer
+
+    if logfile is None:
+        # got closed in the meantime, nothing to do anymore
+        _logfile_flush_timer = None
+        return
+
+    # first drain the entry buffer, then whatever the file's own 8 KiB buffer
+    # still holds (like the header line, which skips the entry buffer)
+    flush()
+    try:
+        logfile.flush()
+    except ValueError:
+        # file got closed between the check above and here, fine with us
+        _logfile_flush_timer = None
+        return
+    _logfile_flush_timer = threading.Timer(
+            LOGFILE_FLUSH_INTERVAL, _flush_logfile_and_reschedule)
+    _logfile_flush_timer.daemon = True
+    _logfile_flush_timer.start()
 
 
 def close_if_needed():
     """Closes the logfile if needed."""
     global logfile
+    global _logfile_flush_timer
+    if _logfile_flush_timer is not None:
+        _logfile_flush_timer.cancel()
+        _logfile_flush_timer = None
     if logfile is not None:
+        # everything still buffered for the logfile has to get out before
+        # closing it
+        flush()
         logfile.close()
         logfile = None
 
 
+def _shutdown():
+    """
+    The one and only atexit hook of this module. Closes whatever logfile is
+    current (which flushes it along the way) and writes out anything still
+    sitting in the buffer for stdout/stderr. Idempotent, so calling it by
+    hand beforehand doesn't hurt.
+    """
+    close_if_needed()
+    flush()
+
+
+# registered exactly once at import instead of over and over in every init*
+# function — re-initializing shouldn't grow the atexit callback list
+atexit.register(_shutdown)
+
+
 def init():
     """
     Initializes logging using the INFO level, e.g. DEBUG messages don't get
@@ -122,8 +279,6 @@ def init():
     mode = Mode.NORMAL
     filterlevel = INFO
 
-    atexit.register(close_if_needed)
-
 
 def init_debug():
     """
@@ -137,8 +292,6 @@ def init_debug():
     mode = Mode.NORMAL
     filterlevel = DEBUG
 
-    atexit.register(close_if_needed)
-
 
 def init_colorless():
     """
@@ -151,8 +304,6 @@ def init_colorless():
     mode = Mode.NONE
     filterlevel = INFO
 
-    atexit.register(close_if_needed)
-
 
 def init_file(file: str):
     """
@@ -162,14 +313,23 @@ def init_file(file: str):
     global logfile
     global mode
     global filterlevel
+    global _logfile_flush_timer
 
     close_if_needed()
     mode = Mode.EXTENSIVE
     filterlevel = DEBUG
-    logfile = open(file, "a")
-    logfile.write(f"   >>> NEW LOG BEGINS AT {get_formatted_datetime()} <<<\n")
+    # binary with an explicit 8 KiB buffer — entries pile up in memory and go
+    # to the kernel as one write instead of one syscall per entry
+    # (_flush_locked takes care of encoding, it sees the missing .encoding)
+    logfile = open(file, "ab", buffering=8192)
+    logfile.write(
+            f"   >>> NEW LOG BEGINS AT {get_formatted_datetime()} <<<\n"
+            .encode())
 
-    atexit.register(close_if_needed)
+    _logfile_flush_timer = threading.Timer(
+            LOGFILE_FLUSH_INTERVAL, _flush_logfile_and_reschedule)
+    _logfile_flush_timer.daemon = True
+    _logfile_flush_timer.start()
 
 
 def log(message: str, level: Level):
@@ -194,27 +354,20 @@ def log(message: str, level: Level):
     #                                  many newline
     #                                  such indent
     formatted_info = format_level(level)
-    splitted_message = iter(message.split("\n"))
-
-    # due to the color escape codes in the NORMAL mode, we just resort to
-    # setting the length manually
-    if mode == Mode.NORMAL:
-        # not concerned? try this
-        # >>> len("//")
-        # 2
-        # >>> len("::")
-        # 2
-        # you get the idea
-        indent = 2
+
+    if "\n" not in message:
+        # by far the most common case: a single line, a single f-string, done
+        # — no list, no split, no join
+        logentry = f"{formatted_info} {message}"
     else:
-        indent = len(formatted_info)
-    indent = " " * indent
+        indent = _INDENTS[mode]
 
-    # now we actually format the message
-    logentry = [f"{formatted_info} {next(splitted_message)}"]
-    for part in splitted_message:
-        logentry.append(f"{indent} {part}")
-    logentry = "\n".join(logentry)
+        # now we actually format the message
+        splitted_message = message.splitlines()
+        logentry = [f"{formatted_info} {splitted_message[0]}"]
+        for part in splitted_message[1:]:
+            logentry.append(f"{indent} {part}")
+        logentry = "\n".join(logentry)
 
     # find the file target we want to write to
     if logfile is None:
@@ -232,14 +385,14 @@ def log(message: str, level: Level):
             # check if the log entry has to be printed before the progress bar, to
             # avoid conflict of entry and bar
             progress._delete_on_stdout()
-            sys.stdout.flush()
             progress.last_print_len = 0  # don't print \b at the _redraw function
     else:
         target = logfile
 
     # the time has come, the logentry is formatted correctly, we've determined
     # where the logentry should be, let's write it to where it belongs
-    print(logentry, file=target)
+    # (errors skip the buffering — they should show up immediately)
+    _buffered_write(logentry + "\n", target, force=level == ERROR)
 
     if logfile is None and progress is not None:
         # output is a terminal and a progress bar is active
@@ -303,19 +456,22 @@ class Progress:
         self.end = end
         self.current = 0
         self.last_print_len = 0
+        self._last_draw = 0.0
 
         progress = self
 
     def _delete_on_stdout(self):
         if self.last_print_len == 0 or logfile is not None:
             return
-        sys.stdout.write("\b" * self.last_print_len)
-        sys.stdout.write(" " * self.last_print_len)
-        sys.stdout.write("\b" * self.last_print_len)
+        _buffered_write(ERASE_LINE, sys.stdout)
 
     def _redraw(self):
-        # first delete all past characters
-        self._delete_on_stdout()
+        # drawing the same bar thousands of times a second helps nobody, so
+        # throttle (the final state always goes through though)
+        now = time.monotonic()
+        if now - self._last_draw < REDRAW_INTERVAL and self.current < self.end:
+            return
+        self._last_draw = now
 
         # compose the new status
         prefix = format_level(INFO)
@@ -338,14 +494,12 @@ class Progress:
             # instead just write the fraction to the file
             status = f"{prefix} {self.message} {fraction}"
 
-            print(status, file=logfile)
+            _buffered_write(status + "\n", logfile)
         else:
-            # print it and update self.last_print_len
+            # one single write which erases the old bar and draws the new one
             status = f"{prefix} {self.message} {fraction} {bar}"
 
-            sys.stdout.write(status)
-
-            sys.stdout.flush()
+            _buffered_write(ERASE_LINE + status, sys.stdout)
             self.last_print_len = len(status)
 
     def stack(self):
@@ -371,8 +525,7 @@ class Progress:
         
         # in a file it doesn't matter
         if logfile is None:
-            sys.stdout.write("\n")
-            sys.stdout.flush()
+            _buffered_write("\n", sys.stdout, force=True)
             self.last_print_len = 0
 
 
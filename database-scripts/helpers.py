@@ -17,9 +17,10 @@
 A helpers module for hardware parsing and comparing, containing common
 constructs and helper functions.
 """
-import json
 import os
 
+import orjson
+
 
 def resource_path(resource_name: str, subfolder: str = "resources") -> str:
     """
@@ -44,12 +45,27 @@ def resource_path(resource_name: str, subfolder: str = "resources") -> str:
 CPU_DATABASE = resource_path("cpu-database.json")
 GPU_DATABASE = resource_path("gpu-database.json")
 
+# NDJSON sidecar where an in-progress parse run persists CPUs one by one —
+# loaded and merged on the next run, so a crash doesn't throw hours away
+CPU_PENDING_DATABASE = CPU_DATABASE + ".pending"
+
 
 class CPU:
     """
     A data model of a CPU. (Clock) Speed is always thought in hertz. The product
     ID is stored in case of a re-retrieval of the database later on.
     """
+    # tens of thousands of these get constructed per run, so: __slots__ saves
+    # the per-instance dict, and the score divisors are hoisted into inverse
+    # class constants instead of being re-evaluated in every __init__
+    __slots__ = ("model", "product_id", "vendor", "corecount", "corespeed",
+            "score")
+
+    # quite similar to the GPU, except that the upper bound is a i9-11900K,
+    # which won't change as well
+    _INV_CORESCORE = 1.0 / 8.0
+    _INV_SPEEDSCORE = 1.0 / (5.30 * (10 ** 9))
+
     def __init__(self,
             model: str,
             product_id: int,
@@ -63,12 +79,8 @@ class CPU:
         self.corespeed = corespeed
 
         # calculate the score of the CPU
-        # quite similar to the GPU, except that the upper bound is a i9-11900K,
-        # which won't change as well
-        corescore = float(corecount) / 8.0
-        speedscore = corespeed / (5.30 * (10 ** 9))
-
-        self.score = (corescore + speedscore) * 100.0 / 2.0
+        self.score = (corecount * self._INV_CORESCORE
+                + corespeed * self._INV_SPEEDSCORE) * 50.0
 
 
 class GPU:
@@ -76,6 +88,17 @@ class GPU:
     A data model of a GPU. Memory is always thought in bytes, (clock) speed always
     in hertz.
     """
+    # see the CPU for why __slots__ and the constants
+    __slots__ = ("model", "vendor", "vram", "corespeed", "codename", "score")
+
+    # the idea is that a score of 0.0 would be a Riva 128, while a score of
+    # 100.0 would be a GeForce RTX 3080
+    # there is no upper bound, 100.0 should always, really always represent
+    # the power of an RTX 3080, if a newer generation with more power comes
+    # out, it might have a score over 100
+    _INV_VRAMSCORE = 1.0 / (10.0 * (1024 ** 3))
+    _INV_CORESPEEDSCORE = 1.0 / (1440.0 * (10 ** 6))
+
     def __init__(self,
             model: str,
             vendor: str,
@@ -89,21 +112,16 @@ class GPU:
         self.codename = codename
 
         # calculate the score of the GPU
-        # the idea is that a score of 0.0 would be a Riva 128, while a score of
-        # 100.0 would be a GeForce RTX 3080
-        # there is no upper bound, 100.0 should always, really always represent
-        # the power of an RTX 3080, if a newer generation with more power comes
-        # out, it might have a score over 100
-        vramscore = float(vram) / (10.0 * (1024 ** 3))
-        corespeedscore = float(corespeed) / (1440.0 * (10 ** 6))
-
-        self.score = (vramscore + corespeedscore) * 100.0 / 2.0
+        self.score = (vram * self._INV_VRAMSCORE
+                + corespeed * self._INV_CORESPEEDSCORE) * 50.0
 
 
 def load_cpus(targetfile: str = CPU_DATABASE):
     try:
-        with open(targetfile) as fh:
-            raw_cpus = json.load(fh)
+        # orjson chews through the raw bytes a lot faster than stdlib json
+        # does through a decoded string
+        with open(targetfile, "rb") as fh:
+            raw_cpus = orjson.loads(fh.read())
         cpus = []
         for (model, specs) in raw_cpus.items():
             cpus.append(CPU(
@@ -113,30 +131,66 @@ def load_cpus(targetfile: str = CPU_DATABASE):
                 specs["corecount"],
                 specs["corespeed"],
             ))
-        return cpus
     except FileNotFoundError:
-        return []
+        cpus = []
+
+    # merge in whatever an interrupted parse run already got done
+    try:
+        with open(CPU_PENDING_DATABASE, "rb") as fh:
+            known_ids = {cpu.product_id for cpu in cpus}
+            for line in fh:
+                if not line.strip():
+                    continue
+                specs = orjson.loads(line)
+                if specs["product_id"] in known_ids:
+                    continue
+                cpus.append(CPU(
+                    specs["model"],
+                    specs["product_id"],
+                    specs["vendor"],
+                    specs["corecount"],
+                    specs["corespeed"],
+                ))
+    except FileNotFoundError:
+        # no interrupted run around, which is the usual case
+        pass
+
+    return cpus
 
 
 def save_cpus(cpus: list[CPU], targetfile: str = CPU_DATABASE):
     """Saves the CPUs into a JSON file."""
-    conv_cpus = {
-        cpu.model: {
-            "product_id": cpu.product_id,
-            "vendor": cpu.vendor,
-            "corecount": cpu.corecount,
-            "corespeed": cpu.corespeed,
-            "score": cpu.score,
-        } for cpu in cpus
-    }
-    with open(targetfile, "w") as fh:
-        json.dump(conv_cpus, fh)
+    # write entry by entry with orjson instead of building one giant
+    # intermediate dict and shoving it through the (pure-Python) json encoder
+    with open(targetfile, "wb") as fh:
+        fh.write(b"{")
+        for i, cpu in enumerate(cpus):
+            if i:
+                fh.write(b",")
+            fh.write(orjson.dumps(cpu.model))
+            fh.write(b":")
+            fh.write(orjson.dumps({
+                "product_id": cpu.product_id,
+                "vendor": cpu.vendor,
+                "corecount": cpu.corecount,
+                "corespeed": cpu.corespeed,
+                "score": cpu.score,
+            }))
+        fh.write(b"}")
+
+    if targetfile == CPU_DATABASE:
+        # a full save supersedes anything persisted by interrupted runs
+        try:
+            os.remove(CPU_PENDING_DATABASE)
+        except FileNotFoundError:
+            pass
 
 
 def load_gpus(targetfile: str = GPU_DATABASE):
     try:
-        with open(targetfile) as fh:
-            raw_gpus = json.load(fh)
+        # see load_cpus
+        with open(targetfile, "rb") as fh:
+            raw_gpus = orjson.loads(fh.read())
         gpus = []
         for (model, specs) in raw_gpus.items():
             gpus.append(GPU(
@@ -154,18 +208,43 @@ def load_gpus(targetfile: str = GPU_DATABASE):
 
 def save_gpus(gpus: list[GPU], targetfile: str = GPU_DATABASE):
     """Saves the GPUs into a JSON file."""
-    # convert them into a nicer dict first
-    conv_gpus = {
-            gpu.model: {
+    # see save_cpus for why this streams instead of building a dict
+    with open(targetfile, "wb") as fh:
+        fh.write(b"{")
+        for i, gpu in enumerate(gpus):
+            if i:
+                fh.write(b",")
+            fh.write(orjson.dumps(gpu.model))
+            fh.write(b":")
+            fh.write(orjson.dumps({
                 "vendor": gpu.vendor,
                 "vram": gpu.vram,
                 "corespeed": gpu.corespeed,
                 "codename": gpu.codename,
                 "score": gpu.score,
-            } for gpu in gpus
-        }
-    with open(targetfile, "w") as fh:
-        json.dump(conv_gpus, fh)
+            }))
+        fh.write(b"}")
+
+
+# the factor per unit, computed exactly once — the conversion helpers below
+# run once per parsed page/row, so no point in redoing 10 ** 12 every call
+BYTE_UNITS = {
+    "b": 1,
+    "kb": 1024,
+    "kib": 1024,
+    "mb": 1024 ** 2,
+    "mib": 1024 ** 2,
+    "gb": 1024 ** 3,
+    "gib": 1024 ** 3,
+    "tb": 1024 ** 4,
+    "tib": 1024 ** 4,
+}
+HERTZ_UNITS = {
+    "khz": 10 ** 3,
+    "mhz": 10 ** 6,
+    "ghz": 10 ** 9,
+    "thz": 10 ** 12,
+}
 
 
 def human_readable_to_bytes(value: int, unit: str) -> int:
@@ -177,40 +256,17 @@ def human_readable_to_bytes(value: int, unit: str) -> int:
     MiB, which is 1024 * 1024. Even Windows displays as unit GB, even though
     it's actually MiB.
     """
-    unit = unit.casefold()
-
-    if unit == "b":
-        return value
-    elif unit == "kb" or unit == "kib":
-        return value * 1024
-    elif unit == "mb" or unit == "mib":
-        return value * (1024 ** 2)
-    elif unit == "gb" or unit == "gib":
-        return value * (1024 ** 3)
-    elif unit == "tb" or unit == "tib":
-        return value * (1024 ** 4)
-    else:
-        # there's more, but that's extremely unlikely
-        return value
+    # unknown units just default to factor 1
+    # there's more than what's listed, but that's extremely unlikely
+    return value * BYTE_UNITS.get(unit.casefold(), 1)
 
 
 def human_readable_to_hertz(value: int, unit: str) -> int:
     """
     Converts the given hertz and unit (GHz or MHz or whatever) to Hz.
     """
-    unit = unit.casefold()
-
-    if unit == "khz":
-        return value * (10 ** 3)
-    elif unit == "mhz":
-        return value * (10 ** 6)
-    elif unit == "ghz":
-        return value * (10 ** 9)
-    elif unit == "thz":
-        return value * (10 ** 12)
-    else:
-        # see human_readable_to_bytes
-        return value
+    # see human_readable_to_bytes for the handling of unknown units
+    return value * HERTZ_UNITS.get(unit.casefold(), 1)
 
 
 # vim:textwidth=80:
@@ -16,13 +16,23 @@
 """
 A module which parses Intel's archive for CPU information. 
 """
+import gzip
+import pathlib
+import queue
+import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
+import orjson
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from lxml import etree
+from lxml import html as lxml_html
 
-from helpers import CPU, save_cpus, human_readable_to_hertz
+from helpers import CPU, CPU_PENDING_DATABASE, save_cpus
 import dogelog
 
 
@@ -31,31 +41,81 @@ STARTID = 27994
 ENDID = 215570
 RATE_LIMIT_DELAY=55
 
+# how many requests to keep in flight at once — each single one mostly waits
+# for the server anyways, so overlapping them hides the round-trip time
+WORKER_COUNT = 48
+
 
 TARGETURL = "https://ark.intel.com/content/www/us/en/ark/products/{0}/i-am-a-dolphin.html"
 
+# fetched pages land here gzipped, so a crash or ratelimit doesn't force
+# re-downloading everything on the next run
+CACHE_DIR = pathlib.Path("cache/intel_ark")
+
+
+# when a worker runs into the ratelimit, it pushes this deadline into the
+# future and every request checks it before going out — so the backoff
+# happens once and all workers wait it out in parallel, instead of every
+# failed worker serially sleeping the full delay on its own
+_ratelimit_lock = threading.Lock()
+_ratelimit_until = 0.0
+
+# compiled once — re-parsing the XPath expression on every of the ~190k pages
+# (and three times per page at that) adds up
+_DATA_KEY_XPATH = etree.XPath("string(//*[@data-key=$key])")
+_TITLE_XPATH = etree.XPath("string(//title)")
 
-def parse_cpu(website: BeautifulSoup, product_id: int) -> Optional[CPU]:
-    """Parses the given Intel ARK website for a CPU."""
+# the clock speed is always "<number> <prefix>Hz" modulo whitespace, so one
+# match plus one multiplier lookup covers it
+CLOCK_REGEX = re.compile(r"([\d.]+)\s*([kmgtKMGT])[Hh]z")
+CLOCK_MULTIPLIERS = {"k": 10 ** 3, "m": 10 ** 6, "g": 10 ** 9, "t": 10 ** 12}
+
+
+def _build_session() -> requests.Session:
+    """
+    Builds the one requests session shared by all workers, with keep-alive, a
+    big enough connection pool and retries on the usual transient statuses.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+            pool_connections=64,
+            pool_maxsize=64,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.5,
+                status_forcelist=[429, 500, 502, 503, 504],
+            ),
+        )
+    session.mount("https://", adapter)
+    return session
+
+
+def parse_cpu(website, product_id: int) -> Optional[CPU]:
+    """Parses the given Intel ARK website (a lxml tree) for a CPU."""
     # thanks for making accessing so easy btw.
 
     # a simple string used for identification of the CPU
-    raw = website.find(attrs={"data-key": "ProcessorNumber"})
-    if raw is None:
+    raw = _DATA_KEY_XPATH(website, key="ProcessorNumber").strip()
+    if not raw:
         # too old CPU, got no processor ID, I have no other idea how I could
         # identify it - just skip it
         return None
-    model = raw.string.strip().casefold()
+    model = raw.casefold()
 
     # just a number like 42 or 0 or... 8
-    raw = website.find(attrs={"data-key": "CoreCount"}).string
+    raw = _DATA_KEY_XPATH(website, key="CoreCount")
     corecount = int(raw)
 
     # a bit more complicated, could be "4.2 GHz" but also "   1337.42 MHz"
-    raw = website.find(attrs={"data-key": "ClockSpeed"}).string.strip().split()
-    value = float(raw[0])
-    unit = raw[1]
-    corespeed = human_readable_to_hertz(value, unit)
+    raw = _DATA_KEY_XPATH(website, key="ClockSpeed")
+    match = CLOCK_REGEX.search(raw)
+    if match is None:
+        # no clock speed we can make sense of
+        return None
+    corespeed = int(
+            float(match.group(1))
+            * CLOCK_MULTIPLIERS[match.group(2).casefold()]
+        )
 
     return CPU(
             model,
@@ -66,62 +126,190 @@ def parse_cpu(website: BeautifulSoup, product_id: int) -> Optional[CPU]:
         )
 
 
+def _cache_path(product_id: int) -> pathlib.Path:
+    """
+    Returns the cache file for the given product. Sharded into subfolders of
+    1000 each, so no single folder grows into six digits of entries.
+    """
+    return CACHE_DIR / str(product_id // 1000) / f"{product_id}.html.gz"
+
+
+def _fetch(session: requests.Session, product_id: int) -> Optional[bytes]:
+    """
+    Returns the raw page bytes for the given product, preferring the on-disk
+    cache over asking the server. Returns None if the page doesn't exist or
+    the fetch failed.
+    """
+    global _ratelimit_until
+
+    path = _cache_path(product_id)
+    try:
+        cached = path.read_bytes()
+    except OSError:
+        cached = None
+
+    if cached is not None:
+        if not cached:
+            # a zero-byte file is our marker for "known 404"
+            return None
+        return gzip.decompress(cached)
+
+    # respect a running ratelimit backoff before asking the server anything
+    while True:
+        with _ratelimit_lock:
+            remaining = _ratelimit_until - time.monotonic()
+        if remaining <= 0:
+            break
+        time.sleep(remaining)
+
+    try:
+        response = session.get(TARGETURL.format(product_id), timeout=10)
+    except requests.Timeout:
+        dogelog.error(f"Request for product ID {product_id} timed out")
+        return None
+    except requests.exceptions.ConnectionError:
+        dogelog.error(f"Connection error for ID {product_id}")
+        return None
+
+    if response.status_code == 404:
+        # note the 404 down so re-runs don't ask the server again
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"")
+        return None
+    elif response.status_code != 200:
+        dogelog.error(f"Hitted the ratelimit, delaying next check for "
+                f"{RATE_LIMIT_DELAY} seconds. ID: {product_id}")
+        # see the deadline comment above — everyone pauses until the same
+        # point in time, and concurrent failures don't stack their delays
+        with _ratelimit_lock:
+            _ratelimit_until = max(
+                    _ratelimit_until,
+                    time.monotonic() + RATE_LIMIT_DELAY,
+                )
+        return None
+    # else, website is okay
+
+    content = response.content
+    # compression level 1 is nearly memcpy speed and still shrinks the pages
+    # by roughly 5x
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(gzip.compress(content, 1))
+    return content
+
+
+def _fetch_and_parse(session: requests.Session, product_id: int) -> Optional[CPU]:
+    """
+    Fetches and parses a single product page. Runs on a worker thread —
+    parsing happens here on purpose, lxml releases the GIL for the heavy
+    lifting, so the workers actually parse in parallel too.
+    """
+    content = _fetch(session, product_id)
+    if content is None:
+        return None
+
+    # build the tree straight out of the raw bytes — going through .text would
+    # decode to str just for lxml to encode it right back
+    website = lxml_html.fromstring(content)
+
+    title = _TITLE_XPATH(website)
+    if "Processor" not in title:
+        # not a CPU
+        return None
+
+    # well, it's a CPU then - let's parse it
+    return parse_cpu(website, product_id)
+
+
+def _persist_worker(persist_queue: "queue.Queue[Optional[CPU]]"):
+    """
+    Appends every CPU put onto the queue to the pending NDJSON sidecar, one
+    CPU per line. That way a crash or Ctrl-C hours into the run doesn't throw
+    all already parsed CPUs away — load_cpus picks the sidecar up again on the
+    next run. A None on the queue shuts the worker down.
+    """
+    with open(CPU_PENDING_DATABASE, "ab") as fh:
+        while True:
+            cpu = persist_queue.get()
+            if cpu is None:
+                break
+            fh.write(orjson.dumps({
+                "model": cpu.model,
+                "product_id": cpu.product_id,
+                "vendor": cpu.vendor,
+                "corecount": cpu.corecount,
+                "corespeed": cpu.corespeed,
+            }))
+            fh.write(b"\n")
+            # one flush per CPU is cheap at this rate, and it's the whole
+            # point: the line has to actually be on disk before a crash
+            fh.flush()
+
+
 def parse(old_cpus: list[CPU]) -> list[CPU]:
     """
     Parses the Intel archive for CPUs. Ignores already present CPUs by comparing
     the product ID.
     """
-    old_cpus = [cpu.product_id for cpu in old_cpus]
+    old_ids = frozenset(cpu.product_id for cpu in old_cpus)
     cpus = []
     progress = dogelog.Progress("Extracting Intel CPUs", ENDID - STARTID)
 
-    # just checking every possible product ID
+    # just checking every possible product ID, minus the ones we already know
+    # about — no need for stressing the server unneededly
     # (not using `id` as name because that would conflict with the builtin `id`
     # function
-    for product_id in range(STARTID, ENDID + 1):
-        if product_id in old_cpus:
-            # we already know about this one, no need for stressing the server
-            # unneededly
-            dogelog.info(f"Skipping CPU {product_id}")
-            continue
-        progress.stack()
-
-        try:
-            response = requests.get(TARGETURL.format(product_id), timeout=10)
-        except requests.Timeout:
-            dogelog.error(f"Request for product ID {product_id} timed out")
-            continue
-        except requests.exceptions.ConnectionError:
-            dogelog.error(f"Connection error for ID {product_id}")
-            continue
-        except KeyboardInterrupt:
-            break
-
-        if response.status_code == 404:
-            continue
-        elif response.status_code != 200:
-            dogelog.error(f"Hitted the ratelimit, delaying next check for"\
-                    "{RATE_LIMIT_DELAY} seconds. ID: {product_id}")
-            time.sleep(RATE_LIMIT_DELAY)
-        # else, website is okay
-
-        website = BeautifulSoup(response.text, features="lxml")
-
-        try:
-            if "Processor" not in website.head.title.string:
-                # not a CPU
-                continue
-        except:
-            continue
-
-        # well, it's a CPU then - let's parse it
-        cpu = parse_cpu(website, product_id)
+    ids_to_fetch = [
+        product_id
+        for product_id in range(STARTID, ENDID + 1)
+        if product_id not in old_ids
+    ]
+    skipped = (ENDID - STARTID + 1) - len(ids_to_fetch)
+    if skipped:
+        dogelog.info(f"Skipping {skipped} already known CPUs")
+        # push the bar over all skipped IDs at once
+        progress.increase(skipped)
 
-        if cpu is None:
-            continue
+    # every successfully parsed CPU goes straight to disk through this queue,
+    # so an interrupted run can resume instead of redoing everything
+    persist_queue = queue.Queue()
+    persist_thread = threading.Thread(target=_persist_worker,
+            args=(persist_queue,), daemon=True)
+    persist_thread.start()
 
-        cpus.append(cpu)
+    # the loop is completely bound by the round-trip time to the server, so
+    # overlap the requests over a pile of threads sharing one session
+    session = _build_session()
+    pending = 0
+    try:
+        with ThreadPoolExecutor(max_workers=WORKER_COUNT) as executor:
+            try:
+                for cpu in executor.map(
+                        lambda product_id:
+                            _fetch_and_parse(session, product_id),
+                        ids_to_fetch):
+                    # ticking the bar for every single page is pure overhead
+                    # at this rate, advance it in batches instead
+                    pending += 1
+                    if pending >= 64:
+                        progress.increase(pending)
+                        pending = 0
+                    if cpu is None:
+                        continue
+                    cpus.append(cpu)
+                    persist_queue.put(cpu)
+            except KeyboardInterrupt:
+                # throw the queued-up fetches away *before* leaving the with
+                # block — its implicit shutdown(wait=True) would otherwise
+                # work through every single remaining request first, which
+                # makes Ctrl-C hang for the rest of the scrape
+                executor.shutdown(cancel_futures=True)
+    finally:
+        # let the writer drain what's left — even on Ctrl-C, everything parsed
+        # so far ends up persisted
+        persist_queue.put(None)
+        persist_thread.join()
 
+    progress.increase(pending)
     progress.finish()
 
     return cpus
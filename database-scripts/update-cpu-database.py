@@ -16,6 +16,8 @@
 """
 Creates a CPU database for CPUs by intel and amd. They might not be exhaustive.
 """
+from operator import attrgetter
+
 import intel_ark
 import helpers
 import dogelog
@@ -25,16 +27,16 @@ if __name__ == "__main__":
     dogelog.init()
 
     # the old CPUs, using the product ID to avoid asking the server for an
-    # already known CPU
+    # already known CPU (no sorting needed, membership checks go through a
+    # set anyways)
     old_cpus = helpers.load_cpus()
-    old_cpus.sort(key=lambda cpu: cpu.product_id)
 
     # parsing all needed CPUs... AAAAAAAA
     cpus = intel_ark.parse(old_cpus)
 
     # done, let's clean up and save
     cpus.extend(old_cpus)
-    cpus.sort(key=lambda cpu: cpu.model)
+    cpus.sort(key=attrgetter("model"))
     helpers.save_cpus(cpus)
     dogelog.info(f"Done with CPUs, saved to:\n{helpers.CPU_DATABASE}")
 
@@ -17,6 +17,8 @@
 Creates a GPU database for GPUs by nvidia, amd and intel.
 They might not be exhaustive nor correct.
 """
+from operator import attrgetter
+
 import wiki_gpu_tables
 import helpers
 import dogelog
@@ -38,8 +40,8 @@ if __name__ == "__main__":
     dogelog.info("Beginning to parse GPUs...")
 
     # read in the old GPU database to avoid re-parsing already known GPUs
+    # (no need to sort them, they're only used for skipping)
     old_gpus = helpers.load_gpus()
-    old_gpus.sort(key=lambda gpu: gpu.model)
 
     # parse GPUs
     gpus = []
@@ -51,7 +53,7 @@ if __name__ == "__main__":
     gpus.extend(old_gpus)
 
     # cleaning up and saving
-    gpus.sort(key=lambda gpu: gpu.model)
+    gpus.sort(key=attrgetter("model"))
     helpers.save_gpus(gpus)
     dogelog.info(f"Done with GPUs, saved to:\n{helpers.GPU_DATABASE}")
 
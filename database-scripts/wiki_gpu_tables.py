@@ -17,38 +17,127 @@
 Just a helper module which is made for parsing GPU tables on Wikipedia. There
 should be no need to execute this manually.
 """
+from concurrent.futures import ProcessPoolExecutor
 from enum import IntEnum
+from io import StringIO
+from itertools import repeat
+import functools
+import gzip
+import hashlib
+import pathlib
 import re
 from typing import Optional
 
 import pandas as pd
+import requests
+from lxml import html as lxml_html
+
 import dogelog
-from helpers import GPU, save_gpus, human_readable_to_bytes,\
-    human_readable_to_hertz
+from helpers import GPU, save_gpus, BYTE_UNITS, HERTZ_UNITS
+
+
+# fetched pages land here gzipped, same as the intel_ark cache — iterating on
+# the parsing logic then doesn't re-pay the download every run; delete the
+# folder to force a refresh
+CACHE_DIR = pathlib.Path("cache/wiki_gpu_tables")
+
+# what intel gets after Gen 8, where no table lists a memory size (see the
+# vram check in _extract_from_table)
+_INTEL_FIXED_VRAM = 3000 * BYTE_UNITS["mib"]
+
+# the unit tokens COLUMN_REGEX requires in parens somewhere in the headers —
+# the prefilter in _extract_from_table uses them to drop hopeless tables
+# before any of the vectorized classification runs
+_TOKEN_REGEX = re.compile(r"[a-z]+")
+_CLOCK_UNIT_TOKENS = frozenset(("mhz", "ghz"))
+_VRAM_UNIT_TOKENS = frozenset(("mb", "mib", "gb", "gib"))
+
+# classifies a column header in one single pass: which group matched tells the
+# kind of column, and the unit comes out of the same match — way less work than
+# chaining ten substring checks plus a second regex just for the unit
+# (the unit is always the last parenthesized part, hence the greedy .*)
+COLUMN_REGEX = re.compile(
+        r"(?:(?P<vram>size|dvmt).*\((?P<vram_unit>[mg]i?b)\))"
+        r"|(?:(?P<corespeed>core|average|base|max).*\((?P<corespeed_unit>[mg]hz)\))"
+        r"|(?P<codename>code)"
+    )
 
 
-VALUEREGEX = re.compile(r".+\((\w+)\)")
+# the first run of digits in a value, whatever comes in front of it
+_DIGITS_REGEX = re.compile(r"\D*(\d+)")
 
 
+# memoized — the same cell contents show up over and over across a table
+# (shared codenames, the usual memory sizes, ...), so most calls are repeats
+@functools.lru_cache(maxsize=8192)
 def strip_unimportant(source: str) -> str:
     """
     Strips unimportant information like footnotes, alternative names, or weird
     spaces.
     """
-    stripped = ""
-    for char in source:
-        # remove footnotes like RTX 3080[155]
-        if char == "[" or char == "(":
-            break
-        # remove weird spaces like U+00A0 and make them normal
-        if char.isspace():
-            char = " "
-        
-        stripped += char
-    stripped = stripped.strip()
-    return stripped
-
-
+    # this runs on every single cell, so everything here stays in C: the two
+    # partitions cut off footnotes like RTX 3080[155] and parenthesized
+    # alternative names, and split/join turns every run of weird whitespace
+    # (U+00A0 and friends) into one normal space while stripping the ends
+    return " ".join(source.partition("[")[0].partition("(")[0].split())
+
+
+def _giga_truncation(length: int) -> Optional[int]:
+    # pretend that the maximum realistic value is 64, so 2 characters
+    # example of an odd length:
+    #     32
+    #     64
+    return 2 if length % 2 else None
+
+
+def _mega_truncation(length: int) -> Optional[int]:
+    # the realistic character limit here is 4:
+    #     1234
+    #     5678
+    if length % 4 == 0:
+        return 4
+    # here it is 3, many amd cards are displayed as normal clock first, and
+    # boost clock second
+    #     123
+    #     456
+    # we only care about the core clock
+    # sometimes also there are *three* values, so modulo it is, see the
+    # GeForce GT 650M
+    #     123
+    #     456
+    #     789
+    if length % 3 == 0:
+        return 3
+    return None
+
+
+# how many leading characters of a glued-together value actually belong to the
+# first number, precomputed into one table instead of an if/elif cascade
+# running on every single cell — the exact entries win over the modulo rules
+#
+# 7 is simply 3 + 4, while 10 and 11 are the *begins to cry* cases of a lot of
+# amd GPUs with their memory listed as
+#      123            123
+#      456     and    4567
+#      7890           8901
+_EXACT_TRUNCATION = {
+        (unit, length): 3
+        for unit in ("mb", "mib", "mhz")
+        for length in (7, 10, 11)
+    }
+_TRUNCATION_RULES = {
+        "gb": _giga_truncation,
+        "gib": _giga_truncation,
+        "ghz": _giga_truncation,
+        "mb": _mega_truncation,
+        "mib": _mega_truncation,
+        "mhz": _mega_truncation,
+    }
+
+
+# memoized for the same reason as strip_unimportant — whole GPU generations
+# share their memory sizes and clock speeds
+@functools.lru_cache(maxsize=8192)
 def guess_newline(value: str, unit: str) -> float:
     """
     Tries to guess where a newline in the given value with the given unit could
@@ -62,111 +151,229 @@ def guess_newline(value: str, unit: str) -> float:
     not as two values "1234" and "5678", but instead as "12345678"! This causes
     some GPUs having an unrealistic score.
     """
-    # first, strip away everything which is not a digit AND in front of the
-    # string
-    number_begin = 0
-    for (i, char) in enumerate(value):
-        if char.isdigit():
-            number_begin = i
-            break
-    value = value[number_begin:]
-    # second, split up values like "2-4" to only contain the first number
-    for i, char in enumerate(value):
-        if not char.isdigit():
-            value = value[:i]
-            break
+    # grab the first run of digits — cuts away leading non-digit junk and
+    # splits up values like "2-4" in one C-level match instead of two
+    # per-character loops
+    match = _DIGITS_REGEX.match(value)
+    if match is None:
+        # not a number at all, so probably the footer of the table
+        raise ValueError(f"no number found in {value!r}")
+    value = match.group(1)
 
     if value[-1] == "7":
         # evil footnote delegator, don't ask
         value = value[:-1]
 
-    if unit == "gb" or unit == "gib" or unit == "ghz":
-        # pretend that the maximum realistic value is 64, so 2 characters
-        if len(value) % 2:
-            # example:
-            #     32
-            #     64
-            return float(value[:2])
-        else:
-            return float(value)
-    elif unit == "mb" or unit == "mib" or unit == "mhz":
-        # *begins to cry*
-        if len(value) == 7:
-            return float(value[:3])
-        # the realistic character limit here is 4:
-        #     1234
-        #     5678
-        elif len(value) % 4 == 0:
-            return float(value[:4])
-        # or not, a lot of amd GPUs got their memory listed like this
-        #      123
-        #      456
-        #      7890
-        # so... welp, just search for length 10 and take the first 3 ones I guess
-        elif len(value) == 10:
-            return float(value[:3])
-        # or it can be even worse and this
-        #     123
-        #     4567
-        #     8901
-        elif len(value) == 11:
-            return float(value[:3])
-        # here it is 3, many amd cards are displayed as normal clock first, and
-        # boost clock second
-        #     123
-        #     456
-        # we only care about the core clock
-        # sometimes also there are *three* values, so I'll just use modulo here
-        # see GeForce GT 650M
-        #     123
-        #     456
-        #     789
-        elif len(value) % 3 == 0:
-            return float(value[:3])
+    # exact lookup first (covers the oddball mega lengths), then the modulo
+    # rule of the unit — one hash lookup replaces the whole branch cascade
+    # that used to live here (its reasoning is documented at the tables above)
+    truncate_to = _EXACT_TRUNCATION.get((unit, len(value)))
+    if truncate_to is None:
+        rule = _TRUNCATION_RULES.get(unit)
+        if rule is not None:
+            truncate_to = rule(len(value))
+    if truncate_to is not None:
+        return float(value[:truncate_to])
     return float(value)
 
 
-def parse_gpu(row, indices: dict, vendor: str) -> Optional[GPU]:
-    """Parses a GPU out of the given row and the given indices."""
-    # model (always the first column, but a bit messy)
-    model = strip_unimportant(row[0]).casefold()
-
+def parse_gpu(row, model: str, codename: str,
+        indices: dict) -> Optional[tuple]:
+    """
+    Parses the specs of a GPU out of the given row and the given indices,
+    returned as a (model, vram, corespeed, codename) tuple ready for batch
+    construction. The model and codename are already cleaned up by the
+    vectorized pass in _extract_from_table.
+    """
     # VRAM (assumed to be GiB)
     if indices["vram"] is not None:
         raw = row[indices["vram"][0]]
 
-        raw = strip_unimportant(str(raw))
-        raw = guess_newline(raw, indices["vram"][1])
+        if isinstance(raw, (int, float)) and raw == raw:
+            # pandas already inferred a clean numeric column, the whole
+            # string round-trip would be wasted work (NaN intentionally
+            # falls through — it stringifies to "nan" and trips the same
+            # footer catch a garbage cell would)
+            raw = float(raw)
+        else:
+            raw = strip_unimportant(str(raw))
+            raw = guess_newline(raw, indices["vram"][1])
 
-        vram = human_readable_to_bytes(raw, indices["vram"][1])
+        vram = raw * indices["vram"][2]
     else:
         # we're after Gen 8 from intel, let's hardcode 3000 MiB
-        vram = human_readable_to_bytes(3000, "mib")
+        vram = _INTEL_FIXED_VRAM
 
     # core speed (assumed to be MHz)
     # reminder: indices["corespeed"] is a tuple consisting out of
-    # (index, unit)
+    # (index, unit, multiplier)
     raw = row[indices["corespeed"][0]]
 
-    raw = strip_unimportant(str(raw))
-    raw = guess_newline(raw, indices["corespeed"][1])
-
-    corespeed = human_readable_to_hertz(raw, indices["corespeed"][1])
+    if isinstance(raw, (int, float)) and raw == raw:
+        # see the vram cell above
+        raw = float(raw)
+    else:
+        raw = strip_unimportant(str(raw))
+        raw = guess_newline(raw, indices["corespeed"][1])
 
-    # codename (quite simple as it's a string)
-    codename = strip_unimportant(row[indices["codename"]])
+    corespeed = raw * indices["corespeed"][2]
 
     # api (a complicated string that needs parsing for enums)
     # apilevels = parse_apilevel(row[indices["apilevel"]])
 
-    gpu = GPU(
-        model,
-        vendor,
-        vram,
-        corespeed,
-        codename,
-    )
-    return gpu
+    return (model, vram, corespeed, codename)
+
+
+def _extract_from_table(table: pd.DataFrame, vendor: str) -> list[GPU]:
+    """
+    Extracts all GPUs out of one single DataFrame. Returns an empty list if
+    the table turns out to be uninteresting. Runs on a worker process, so no
+    shared state besides the arguments, please.
+    """
+    gpus = []
+
+    # a GPU spec table needs at least model, clock and codename columns —
+    # anything slimmer (or outright empty) is a legend or a layout leftover,
+    # no point in even looking at its headers
+    if not len(table) or len(table.columns) < 3:
+        return gpus
+
+    # only the last element of multi-level headers actually matters
+    idents = [
+        ident[-1] if isinstance(ident, tuple) else ident
+        for ident in table.axes[1]
+    ]
+    if any(isinstance(ident, int) for ident in idents):
+        # ??? didn't find the actual table for this one, just ignore it
+        # I guess
+        dogelog.debug(f"That table's weird:\n{table}")
+        return gpus
+
+    # classify all headers at once through pandas' vectorized string ops
+    # instead of a Python regex call per column
+    # case sensitivity doesn't make much sense here, so the whole index gets
+    # casefolded once up front — that spares both the case-insensitive
+    # matching below and the repeated per-header casefolds afterwards
+    idents = pd.Index(idents).astype(str).str.casefold()
+
+    # one more cheap prefilter before the classification below: tokenize the
+    # joined headers once, then set intersections answer whether the
+    # required columns can possibly all turn up — the classifier needs the
+    # clock unit in parens always, and a vram unit too unless this is intel
+    # (where vram is allowed to be missing, see further down)
+    joined = " ".join(idents)
+    tokens = frozenset(_TOKEN_REGEX.findall(joined))
+    if (not tokens & _CLOCK_UNIT_TOKENS
+            or "code" not in joined
+            or (vendor != "intel" and not tokens & _VRAM_UNIT_TOKENS)):
+        return gpus
+
+    # one extract over the combined classifier regex answers everything at
+    # once — which kind every header is *and* which unit it carries — so the
+    # three separate contains scans plus the per-header unit searches
+    # collapse into a single vectorized pass
+    # (the alternatives of COLUMN_REGEX are mutually exclusive per header, so
+    # no priority fixup between the masks is needed)
+    groups = idents.str.extract(COLUMN_REGEX)
+    vram_mask = groups["vram"].notna().to_numpy()
+    corespeed_mask = (
+            groups["corespeed"].notna().to_numpy()
+            & ~idents.str.contains("boost", regex=False)
+        )
+    codename_mask = groups["codename"].notna().to_numpy()
+
+    # vram and corespeed are tuples, consisting out of (index, unit) — same
+    # as with the old per-column loop, the last matching column wins
+    # (yes, "dvmt" technically isn't VRAM)
+    indices = {
+            "vram": None,
+            "corespeed": None,
+            "codename": None
+            #"apilevel": None
+        }
+    hits = vram_mask.nonzero()[0]
+    if len(hits):
+        i = int(hits[-1])
+        indices["vram"] = (i, groups["vram_unit"].iloc[i])
+    hits = corespeed_mask.nonzero()[0]
+    if len(hits):
+        i = int(hits[-1])
+        indices["corespeed"] = (i, groups["corespeed_unit"].iloc[i])
+    hits = codename_mask.nonzero()[0]
+    if len(hits):
+        indices["codename"] = int(hits[-1])
+
+    # check that we got every column we need, else it's not an important
+    # table
+    for (name, index) in indices.items():
+        if index is None:
+            if vendor == "intel" and name == "vram":
+                # on intel gen 8 and later the half of the system memory is
+                # available for graphics use, but since that's kind of hard
+                # to track down, I'll just use fixed 3000 MiB later
+                continue
+            dogelog.debug(f"Skipping table:\n{table}\ndue to unfound {name}")
+            return []
+
+    # the model and codename columns are plain strings, so their cleanup (cut
+    # footnotes and parens, normalize weird spaces, strip) runs vectorized
+    # over the whole column in C instead of through strip_unimportant per cell
+    # (model is always the first column, but a bit messy)
+    models = (
+            table.iloc[:, 0].astype(str)
+            .str.replace(r"[\[(].*", "", regex=True, flags=re.S)
+            .str.replace(r"\s+", " ", regex=True)
+            .str.strip()
+            .str.casefold()
+        )
+    codenames = (
+            table.iloc[:, indices["codename"]].astype(str)
+            .str.replace(r"[\[(].*", "", regex=True, flags=re.S)
+            .str.replace(r"\s+", " ", regex=True)
+            .str.strip()
+        )
+
+    # only the vram and clock cells still get read per row, so project the
+    # table down to exactly those columns and stream row tuples straight out
+    # of the block manager — unlike to_numpy, that doesn't copy the whole
+    # table into one big object array first
+    # the unit of a column is fixed for the whole table, so its factor gets
+    # looked up exactly once here instead of once per row in the helpers
+    used_columns = [indices["corespeed"][0]]
+    corespeed_unit = indices["corespeed"][1]
+    row_indices = {
+            "corespeed": (0, corespeed_unit, HERTZ_UNITS[corespeed_unit]),
+            "vram": None,
+        }
+    if indices["vram"] is not None:
+        used_columns.append(indices["vram"][0])
+        vram_unit = indices["vram"][1]
+        row_indices["vram"] = (1, vram_unit, BYTE_UNITS[vram_unit])
+    projected = table.iloc[:, used_columns]
+
+    # second, walk through the actual table, only collecting the validated
+    # specs — the GPU instances (whose __init__ also computes the score) get
+    # built in one batch afterwards, outside of the guarded loop
+    specs = []
+    # bound once — saves the attribute lookup on every single row
+    specs_append = specs.append
+    for (row, model, codename) in zip(
+            projected.itertuples(index=False, name=None), models, codenames):
+        try:
+            spec = parse_gpu(row, model, codename, row_indices)
+            if spec is not None:
+                # parse_gpu returns None if it is unable to parse the GPU
+                specs_append(spec)
+        except (ValueError, IndexError):
+            # we're on the description in the lower part of the table,
+            # nothing of interest is here anymore
+            break
+
+    gpus.extend(
+            GPU(model, vendor, vram, corespeed, codename)
+            for (model, vram, corespeed, codename) in specs
+        )
+    return gpus
 
 
 def extract_gpus(tables: list[pd.DataFrame], ignore_models: list[str], vendor: str) -> list[GPU]:
@@ -177,102 +384,77 @@ def extract_gpus(tables: list[pd.DataFrame], ignore_models: list[str], vendor: s
     gpus = []
     progress = dogelog.Progress(f"Parsing {vendor} tables...", len(tables))
 
-    for table in tables:
-        progress.stack()
-
-        skip_table = False
-        # find the indices in the table so we can look them up afterwards in the
-        # numpy array in table.values
-        indices = {
-                "vram": None,
-                "corespeed": None,
-                "codename": None
-                #"apilevel": None
-            }
-        for (i, column_ident) in enumerate(table.axes[1]):
-            if isinstance(column_ident, tuple):
-                # only the last element in the tuple matters
-                column_ident = column_ident[-1]
-            if isinstance(column_ident, int):
-                # ??? didn't find the actual table for this one, just ignore it
-                # I guess
-                dogelog.debug(f"That table's weird:\n{table}")
-                skip_table = True
-                break
-            # after this point, we just assume colum_ident is a string
-
-            # case sensitivity doesn't make much sense here
-            column_ident = column_ident.casefold()
-            
-            if (
-                    "size" in column_ident or
-                    "dvmt" in column_ident  # yes, technically it's not VRAM
-                ) and (
-                    "mb" in column_ident or
-                    "mib" in column_ident or
-                    "gb" in column_ident or
-                    "gib" in column_ident
-                ):
-                # vram and corespeed should be a tuple, consisting out of
-                # (index, unit)
-                match = VALUEREGEX.search(column_ident)
-                if "mb" in column_ident and match.group(1) != "mb":
-                    dogelog.info(f"String: {column_ident}\nGroups: {match.groups()}")
-                indices["vram"] = (i, match.group(1))
-            elif (
-                    "core" in column_ident or
-                    "average" in column_ident or
-                    "base" in column_ident or
-                    "max" in column_ident# or
-                    #"clock" in column_ident
-                ) and "boost" not in column_ident and (
-                    "mhz" in column_ident or
-                    "ghz" in column_ident
-                ):
-                match = VALUEREGEX.search(column_ident)
-                indices["corespeed"] = (i, match.group(1))
-            elif "code" in column_ident:
-                indices["codename"] = i
-            #elif "api" in column_ident:
-            #    indices["apilevel"] = i
-
-        # check that we got every column we need, else it's not an important
-        # table
-        for (name, index) in indices.items():
-            if index is None:
-                if vendor == "intel" and name == "vram":
-                    # on intel gen 8 and later the half of the system memory is
-                    # available for graphics use, but since that's kind of hard
-                    # to track down, I'll just use fixed 3000 MiB later
-                    continue
-                dogelog.debug(f"Skipping table:\n{table}\ndue to unfound {name}")
-                skip_table = True
-        
-        if skip_table:
-            continue
-
-        # second, walk through the actual table
-        for row in table.to_numpy():
-            try:
-                gpu = parse_gpu(row, indices, vendor)
-                if gpu is not None:
-                    # parse_gpu returns None if it is unable to parse the GPU
-                    gpus.append(gpu)
-            except (ValueError, IndexError):
-                # we're on the description in the lower part of the table,
-                # nothing of interest is here anymore
-                break
+    # every table is parsed completely independent of the others, and it's
+    # all Python-level string crunching — so spread the tables over all
+    # cores instead of munching them one by one under the GIL
+    # (the progress bar only ever ticks here on the collecting side)
+    gpus_extend = gpus.extend
+    with ProcessPoolExecutor() as executor:
+        for from_table in executor.map(
+                _extract_from_table, tables, repeat(vendor)):
+            gpus_extend(from_table)
+            progress.stack()
 
     progress.finish()
     return gpus
 
 
+def _fetch_page(url: str) -> bytes:
+    """
+    Returns the raw page bytes for the given URL, preferring the on-disk
+    cache over asking the server.
+    """
+    path = CACHE_DIR / (hashlib.sha1(url.encode()).hexdigest() + ".html.gz")
+    try:
+        return gzip.decompress(path.read_bytes())
+    except OSError:
+        # not cached yet, gotta actually download it then
+        pass
+
+    response = requests.get(url, timeout=30)
+    response.raise_for_status()
+    content = response.content
+
+    # compression level 1 is nearly free and still shrinks the page a lot
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(gzip.compress(content, 1))
+    return content
+
+
 def parse(url: str, old_gpus: list[str], vendor: str) -> list[GPU]:
     """
     Parses all tables at the given URL and notes the given vendor down for the
     GPUs.
     """
-    tables = pd.read_html(url)
+    # handing the whole page to read_html at once makes its parser backtrack
+    # across all tables of the combined document — on Wikipedia pages with
+    # dozens of tables that's drastically slower than fetching the page once,
+    # cutting out each <table> with lxml and reading the fragments one by one
+    document = lxml_html.fromstring(_fetch_page(url))
+
+    tables = []
+    for node in document.iter("table"):
+        # only actual spec tables wear the wikitable class — the infoboxes
+        # and navigation tables on those pages aren't even worth handing to
+        # read_html
+        if "wikitable" not in (node.get("class") or ""):
+            continue
+        fragment = lxml_html.tostring(node).decode()
+        try:
+            # flavor pinned so read_html stays on the C-based lxml parser
+            # instead of silently falling back to the way slower bs4 one
+            tables.extend(pd.read_html(StringIO(fragment), flavor="lxml"))
+        except ValueError:
+            # lxml gave up on the markup, let bs4's forgiving parser have one
+            # shot before writing the table off
+            # (the ImportError fires when html5lib isn't installed, in which
+            # case skipping the table beats crashing the whole run)
+            try:
+                tables.extend(pd.read_html(StringIO(fragment), flavor="bs4"))
+            except (ValueError, ImportError):
+                # nothing tabular in there after all
+                continue
+
     gpus = extract_gpus(tables, old_gpus, vendor)
     return gpus
 
@@ -34,6 +34,7 @@ setuptools.setup(
         "PyOpenGL",
         "psutil",
         "py-cpuinfo",
+        "rapidfuzz",
         "setuptools",
     ],
 